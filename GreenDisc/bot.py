@@ -1,194 +1,176 @@
 import os
-import json
-import calendar
+import asyncio
 from datetime import datetime
-from typing import Dict, Any
+from typing import Dict, Tuple
 
 import discord
 from discord.ext import commands
-from dotenv import load_dotenv
 
-# ================== CONFIGURAÇÕES BÁSICAS ==================
-
-load_dotenv()
-TOKEN = os.getenv("DISCORD_TOKEN")
-CALENDAR_CHANNEL_ID = int(os.getenv("CALENDAR_CHANNEL_ID", "0"))
-
-DATA_DIR = "data"
-DATA_FILE = os.path.join(DATA_DIR, "ponto_data.json")
-
-# Estrutura padrão do arquivo de dados
-# {
-#   "registros": {
-#       "2025-11-28": {
-#           "123456789012345678": {
-#               "name": "usuario",
-#               "entrada": "2025-11-28 09:00",
-#               "saida": "2025-11-28 18:00"
-#           }
-#       },
-#       ...
-#   },
-#   "mensagens": {
-#       "2025-11": {
-#           "message_id": 123456789012345678
-#       }
-#   }
-# }
-
-intents = discord.Intents.default()
-intents.message_content = True  # necessário para comandos de texto
-
-bot = commands.Bot(command_prefix="!", intents=intents)
-
-
-# ================== FUNÇÕES DE PERSISTÊNCIA ==================
+from ponto import (
+    DADOS,
+    MESES_PT,
+    inicializar_dados,
+    carregar_mes,
+    flush_dados,
+    flush_loop,
+    formatar_mes,
+    get_date_str,
+    get_month_key,
+    marcar_alterado,
+    obter_dia,
+    renderizar_calendario,
+    versao_dados,
+)
 
-def garantir_arquivo():
-    os.makedirs(DATA_DIR, exist_ok=True)
-    if not os.path.exists(DATA_FILE):
-        with open(DATA_FILE, "w", encoding="utf-8") as f:
-            json.dump({"registros": {}, "mensagens": {}}, f, ensure_ascii=False, indent=2)
-
-
-def carregar_dados() -> Dict[str, Any]:
-    garantir_arquivo()
-    with open(DATA_FILE, "r", encoding="utf-8") as f:
-        return json.load(f)
+# ================== CONFIGURAÇÕES BÁSICAS ==================
 
+# Lidos do .env em __main__ (load_dotenv só roda ao iniciar o bot)
+TOKEN: str | None = None
+CALENDAR_CHANNEL_ID = 0
 
-def salvar_dados(dados: Dict[str, Any]) -> None:
-    with open(DATA_FILE, "w", encoding="utf-8") as f:
-        json.dump(dados, f, ensure_ascii=False, indent=2)
 
+class PontoBot(commands.Bot):
+    async def setup_hook(self):
+        # Roda uma vez, antes de conectar: nenhum evento ou comando é
+        # tratado antes de os dados estarem carregados
+        inicializar_dados()
+        self.flush_task = asyncio.create_task(flush_loop())
 
-def get_month_key(dt: datetime) -> str:
-    return dt.strftime("%Y-%m")
 
+intents = discord.Intents.default()
+intents.message_content = True  # necessário para comandos de texto
 
-def get_date_str(dt: datetime) -> str:
-    return dt.strftime("%Y-%m-%d")
+bot = PontoBot(command_prefix="!", intents=intents)
 
 
-# ================== FUNÇÃO DE RENDERIZAÇÃO DO CALENDÁRIO ==================
+# ================== MENSAGEM DO CALENDÁRIO ==================
 
-MESES_PT = {
-    1: "Janeiro",
-    2: "Fevereiro",
-    3: "Março",
-    4: "Abril",
-    5: "Maio",
-    6: "Junho",
-    7: "Julho",
-    8: "Agosto",
-    9: "Setembro",
-    10: "Outubro",
-    11: "Novembro",
-    12: "Dezembro",
-}
+# Textos já renderizados, indexados por (ano, mês, versão dos dados)
+_render_cache: Dict[Tuple[int, int, int], str] = {}
 
 
-def renderizar_calendario(year: int, month: int, registros: Dict[str, Any]) -> str:
+def renderizar_mes(year: int, month: int) -> str:
     """
-    Gera texto do calendário + lista de registros por dia.
+    Renderiza o mês a partir de DADOS, reaproveitando o texto enquanto
+    os dados não mudarem.
     """
-    cal = calendar.Calendar(firstweekday=0)  # Monday
-    month_key = f"{year:04d}-{month:02d}"
-
-    # 1) Grade do calendário (visual)
-    linhas = []
-    linhas.append("```")
-    linhas.append("Seg Ter Qua Qui Sex Sáb Dom")
-
-    # monthdayscalendar devolve semanas começando em Monday
-    for week in cal.monthdayscalendar(year, month):
-        linha_semana = []
-        # week = [seg, ter, qua, qui, sex, sab, dom]
-        for day in week:
-            if day == 0:
-                linha_semana.append("   ")
-            else:
-                linha_semana.append(f"{day:2d} ")
-        linhas.append(" ".join(linha_semana))
-    linhas.append("```")
-
-    # 2) Detalhes de ponto por dia
-    registros_mes = {}
-    for data_str, usuarios in registros.items():
-        if data_str.startswith(month_key):
-            registros_mes[data_str] = usuarios
-
-    if not registros_mes:
-        linhas.append("_Ainda não há registros de ponto neste mês._")
-        return "\n".join(linhas)
-
-    linhas.append("**Registros de ponto por dia:**")
-    # Ordena os dias
-    for data_str in sorted(registros_mes.keys()):
-        dt = datetime.strptime(data_str, "%Y-%m-%d")
-        dia = dt.day
-        linhas.append(f"\n__Dia {dia:02d}/{month:02d}__")
-        usuarios = registros_mes[data_str]
-        for user_id, info in usuarios.items():
-            nome = info.get("name", str(user_id))
-            entrada = info.get("entrada", "--:--")
-            saida = info.get("saida", "--:--")
-            # Pega só HH:MM
-            if entrada != "--:--" and " " in entrada:
-                entrada = entrada.split(" ")[1][:5]
-            if saida != "--:--" and " " in saida:
-                saida = saida.split(" ")[1][:5]
-            linhas.append(f"- {nome}: entrada {entrada} | saída {saida}")
-
-    return "\n".join(linhas)
+    carregar_mes(formatar_mes(year, month))
+    versao = versao_dados()
+    chave_cache = (year, month, versao)
+    texto = _render_cache.get(chave_cache)
+    if texto is None:
+        # descarta entradas de versões antigas para não crescer sem limite
+        for chave in [k for k in _render_cache if k[2] != versao]:
+            del _render_cache[chave]
+        texto = renderizar_calendario(year, month, DADOS["registros"])
+        _render_cache[chave_cache] = texto
+    return texto
+
+
+# Canal e mensagens já resolvidos, para não repetir fetch_* a cada atualização
+_channel: discord.abc.Messageable | None = None
+_msg_cache: Dict[str, discord.Message] = {}
+# Última descrição enviada por mês, para não editar a mensagem sem mudança
+_last_desc: Dict[str, str] = {}
+
+
+async def obter_canal_calendario(client: discord.Client) -> discord.abc.Messageable:
+    global _channel
+    if _channel is None:
+        canal = client.get_channel(CALENDAR_CHANNEL_ID)
+        if canal is None:
+            canal = await client.fetch_channel(CALENDAR_CHANNEL_ID)
+        _channel = canal
+    return _channel
 
 
 async def atualizar_mensagem_calendario(
     client: discord.Client,
     year: int,
     month: int,
+    forcar: bool = False,
 ):
     """
     Gera/atualiza a mensagem de calendário do mês (um por mês),
     no canal configurado em CALENDAR_CHANNEL_ID.
+    Sem `forcar`, não edita a mensagem se o texto for igual ao último enviado.
     """
     if CALENDAR_CHANNEL_ID == 0:
         print("CALENDAR_CHANNEL_ID não configurado no .env.")
         return
 
-    dados = carregar_dados()
-    registros = dados.get("registros", {})
-    mensagens = dados.get("mensagens", {})
+    month_key = formatar_mes(year, month)
+    mensagens = DADOS.setdefault("mensagens", {})
 
-    month_key = f"{year:04d}-{month:02d}"
-    canal = client.get_channel(CALENDAR_CHANNEL_ID)
-    if canal is None:
-        canal = await client.fetch_channel(CALENDAR_CHANNEL_ID)
+    canal = await obter_canal_calendario(client)
 
     # Renderiza texto do calendário
-    descricao = renderizar_calendario(year, month, registros)
+    descricao = renderizar_mes(year, month)
     titulo = f"Calendário de ponto - {MESES_PT[month]}/{year}"
 
     # Já existe mensagem fixa para este mês?
     message_info = mensagens.get(month_key)
     if message_info:
+        if not forcar and _last_desc.get(month_key) == descricao:
+            return
         message_id = message_info.get("message_id")
         try:
-            msg = await canal.fetch_message(message_id)
-            await msg.edit(content=None, embed=discord.Embed(title=titulo, description=descricao))
+            msg = _msg_cache.get(month_key)
+            if msg is None or msg.id != message_id:
+                msg = await canal.fetch_message(message_id)
+            _msg_cache[month_key] = await msg.edit(
+                content=None, embed=discord.Embed(title=titulo, description=descricao)
+            )
+            _last_desc[month_key] = descricao
             return
         except discord.NotFound:
             # mensagem sumiu, vamos recriar
-            pass
+            _msg_cache.pop(month_key, None)
 
     # Não há mensagem registrada ou sumiu: cria nova
     embed = discord.Embed(title=titulo, description=descricao)
     msg = await canal.send(embed=embed)
+    _msg_cache[month_key] = msg
+    _last_desc[month_key] = descricao
 
     # salva o ID da nova mensagem
     mensagens[month_key] = {"message_id": msg.id}
-    dados["mensagens"] = mensagens
-    salvar_dados(dados)
+    marcar_alterado()
+
+
+# Atualizações pendentes por (ano, mês); cliques em sequência reagendam a
+# mesma atualização em vez de editar a mensagem a cada clique
+_pending_updates: Dict[Tuple[int, int], asyncio.TimerHandle] = {}
+DEBOUNCE_SEGUNDOS = 1.5
+# Referências fortes às tarefas em andamento (o asyncio só guarda referências
+# fracas, e a tarefa poderia ser coletada no meio da execução)
+_update_tasks: set = set()
+
+
+def _finalizar_atualizacao(task: asyncio.Task) -> None:
+    _update_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"Erro ao atualizar o calendário: {task.exception()!r}")
+
+
+def agendar_atualizacao_calendario(client: discord.Client, year: int, month: int) -> None:
+    """
+    Agenda atualizar_mensagem_calendario para daqui a DEBOUNCE_SEGUNDOS,
+    cancelando qualquer atualização já pendente para o mesmo mês.
+    """
+    chave = (year, month)
+    anterior = _pending_updates.pop(chave, None)
+    if anterior is not None:
+        anterior.cancel()
+
+    def disparar():
+        _pending_updates.pop(chave, None)
+        task = asyncio.create_task(atualizar_mensagem_calendario(client, year, month))
+        _update_tasks.add(task)
+        task.add_done_callback(_finalizar_atualizacao)
+
+    loop = asyncio.get_running_loop()
+    _pending_updates[chave] = loop.call_later(DEBOUNCE_SEGUNDOS, disparar)
 
 
 # ================== VIEW COM BOTÕES ==================
@@ -209,37 +191,34 @@ class PontoView(discord.ui.View):
 # ================== LÓGICA DE REGISTRO ==================
 
 async def registrar_ponto(interaction: discord.Interaction, tipo: str):
+    # Um único datetime.now(); todos os campos saem dele
     agora = datetime.now()
-    date_str = get_date_str(agora)      # "YYYY-MM-DD"
-    hora_str = agora.strftime("%Y-%m-%d %H:%M")
-
-    dados = carregar_dados()
-    registros = dados.get("registros", {})
+    month_key = get_month_key(agora)                   # "YYYY-MM"
+    date_str = get_date_str(agora)                     # "YYYY-MM-DD"
+    hora_str = f"{agora.hour:02d}:{agora.minute:02d}"  # "HH:MM"
 
     user_id = str(interaction.user.id)
     nome = interaction.user.display_name
 
-    if date_str not in registros:
-        registros[date_str] = {}
-    if user_id not in registros[date_str]:
-        registros[date_str][user_id] = {
+    usuarios_dia = obter_dia(carregar_mes(month_key), date_str)
+    if user_id not in usuarios_dia:
+        usuarios_dia[user_id] = {
             "name": nome,
             "entrada": "--:--",
             "saida": "--:--",
         }
 
     if tipo == "entrada":
-        registros[date_str][user_id]["entrada"] = hora_str
-        msg_conf = f"Entrada registrada para {nome} às **{hora_str[11:16]}**."
+        usuarios_dia[user_id]["entrada"] = hora_str
+        msg_conf = f"Entrada registrada para {nome} às **{hora_str}**."
     else:
-        registros[date_str][user_id]["saida"] = hora_str
-        msg_conf = f"Saída registrada para {nome} às **{hora_str[11:16]}**."
+        usuarios_dia[user_id]["saida"] = hora_str
+        msg_conf = f"Saída registrada para {nome} às **{hora_str}**."
 
-    dados["registros"] = registros
-    salvar_dados(dados)
+    marcar_alterado(month_key)
 
-    # Atualiza o calendário do mês atual no canal fixo
-    await atualizar_mensagem_calendario(interaction.client, year=agora.year, month=agora.month)
+    # Agenda a atualização do calendário do mês atual no canal fixo
+    agendar_atualizacao_calendario(interaction.client, year=agora.year, month=agora.month)
 
     # Responde ao usuário (mensagem efêmera só pra quem clicou)
     await interaction.response.send_message(msg_conf, ephemeral=True)
@@ -250,7 +229,11 @@ async def registrar_ponto(interaction: discord.Interaction, tipo: str):
 @bot.event
 async def on_ready():
     print(f"Bot conectado como {bot.user} (ID: {bot.user.id})")
-    garantir_arquivo()
+
+
+@bot.event
+async def on_disconnect():
+    flush_dados()
 
 
 @bot.command(name="ponto")
@@ -278,7 +261,7 @@ async def comando_atualizar_calendario(ctx: commands.Context, ano: int | None =
     if mes is None:
         mes = agora.month
 
-    await atualizar_mensagem_calendario(ctx.bot, ano, mes)
+    await atualizar_mensagem_calendario(ctx.bot, ano, mes, forcar=True)
     await ctx.send(f"Calendário de {MESES_PT[mes]}/{ano} atualizado.", delete_after=10)
 
 
@@ -293,10 +276,7 @@ async def comando_calendario(ctx: commands.Context, ano: int, mes: int):
         await ctx.send("Mês inválido. Use um valor entre 1 e 12. Ex.: `!calendario 2024 5`")
         return
 
-    dados = carregar_dados()
-    registros = dados.get("registros", {})
-
-    descricao = renderizar_calendario(ano, mes, registros)
+    descricao = renderizar_mes(ano, mes)
     titulo = f"Calendário de ponto - {MESES_PT[mes]}/{ano}"
     embed = discord.Embed(title=titulo, description=descricao)
 
@@ -306,6 +286,15 @@ async def comando_calendario(ctx: commands.Context, ano: int, mes: int):
 # ================== MAIN ==================
 
 if __name__ == "__main__":
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    TOKEN = os.getenv("DISCORD_TOKEN")
+    CALENDAR_CHANNEL_ID = int(os.getenv("CALENDAR_CHANNEL_ID", "0"))
+
     if not TOKEN:
         raise RuntimeError("DISCORD_TOKEN não foi definido no .env ou nas variáveis de ambiente")
-    bot.run(TOKEN)
+    try:
+        bot.run(TOKEN)
+    finally:
+        flush_dados()
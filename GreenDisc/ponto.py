@@ -0,0 +1,382 @@
+"""
+Persistência e renderização do calendário de ponto.
+
+Não depende do discord, para poder ser importado por scripts (ex.: gerar o
+texto de um mês) sem o custo de carregar o bot.
+"""
+import os
+import asyncio
+import json
+import calendar
+import functools
+from datetime import datetime
+from typing import Dict, Any, Tuple
+
+try:
+    import orjson  # opcional: bem mais rápido que o json da stdlib
+except ImportError:
+    orjson = None
+
+# ================== CONFIGURAÇÕES BÁSICAS ==================
+
+DATA_DIR = "data"
+# Formato antigo (um único arquivo com todo o histórico); migrado na carga
+DATA_FILE = os.path.join(DATA_DIR, "ponto_data.json")
+MENSAGENS_FILE = os.path.join(DATA_DIR, "mensagens.json")
+INDEX_FILE = os.path.join(DATA_DIR, "index.json")
+
+# Os registros ficam num arquivo por mês (data/ponto_YYYY-MM.json), para que
+# cada gravação reescreva só o mês alterado:
+# {
+#   "2025-11-28": {
+#       "123456789012345678": {
+#           "name": "usuario",
+#           "entrada": "09:00",
+#           "saida": "18:00"
+#       }
+#   },
+#   ...
+# }
+#
+# data/mensagens.json guarda a mensagem fixa de cada mês:
+# {
+#   "2025-11": {
+#       "message_id": 123456789012345678
+#   }
+# }
+#
+# data/index.json lista os meses que têm arquivo: {"meses": ["2025-11", ...]}.
+# É só informativo: a leitura de um mês olha direto se o arquivo existe.
+#
+# Em memória, DADOS segue o formato agrupado por mês, com apenas os meses já
+# carregados em "registros":
+# {"registros": {"2025-11": {...}}, "mensagens": {...}}
+
+
+# ================== FUNÇÕES DE PERSISTÊNCIA ==================
+
+# Dados em memória, carregados por inicializar_dados antes de o bot conectar
+# (cada mês sob demanda, via carregar_mes); alterações são gravadas em disco
+# em lote por flush_loop.
+DADOS: Dict[str, Any] = {}
+_carregado = False
+_meses_indexados: set = set()
+_meses_dirty: set = set()
+_mensagens_dirty = False
+FLUSH_INTERVAL = 2.0  # segundos entre gravações
+
+# Versão dos dados; incrementada a cada alteração para invalidar
+# o cache de renderização do bot (ver versao_dados).
+_data_version = 0
+
+
+def _file_for_month(month_key: str) -> str:
+    return os.path.join(DATA_DIR, f"ponto_{month_key}.json")
+
+
+def ler_json(caminho: str) -> Any:
+    if orjson is not None:
+        with open(caminho, "rb") as f:
+            return orjson.loads(f.read())
+    with open(caminho, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def salvar_json(caminho: str, conteudo: Any) -> None:
+    if orjson is not None:
+        payload = orjson.dumps(conteudo, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS)
+    else:
+        payload = json.dumps(conteudo, ensure_ascii=False, indent=2).encode("utf-8")
+
+    # Grava num arquivo temporário e troca de uma vez, para que uma queda no
+    # meio da escrita não corrompa o arquivo de dados
+    tmp = caminho + ".tmp"
+    with open(tmp, "wb", buffering=1 << 16) as f:
+        f.write(payload)
+    os.replace(tmp, caminho)
+
+
+def garantir_arquivo():
+    os.makedirs(DATA_DIR, exist_ok=True)
+    if (
+        os.path.exists(DATA_FILE)
+        and os.path.getsize(DATA_FILE) > 0
+        and not os.path.exists(MENSAGENS_FILE)
+        and not os.path.exists(INDEX_FILE)
+    ):
+        # só migra se os arquivos do formato novo ainda não existem, para
+        # não sobrescrevê-los caso o arquivo antigo reapareça
+        migrar_arquivo_unico()
+    if not os.path.exists(MENSAGENS_FILE):
+        salvar_json(MENSAGENS_FILE, {})
+    if not os.path.exists(INDEX_FILE):
+        salvar_json(INDEX_FILE, {"meses": []})
+
+
+def migrar_registros(registros: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Converte o formato antigo (chaves "YYYY-MM-DD" direto em "registros")
+    para o formato agrupado por mês ("YYYY-MM" -> "YYYY-MM-DD").
+    """
+    migrados: Dict[str, Any] = {}
+    for chave, valor in registros.items():
+        if len(chave) == 10:  # "YYYY-MM-DD": formato antigo
+            migrados.setdefault(chave[:7], {})[chave] = valor
+        else:
+            migrados.setdefault(chave, {}).update(valor)
+    return migrados
+
+
+def migrar_horarios(registros: Dict[str, Any]) -> bool:
+    """
+    Reduz horários no formato antigo "YYYY-MM-DD HH:MM" para só "HH:MM"
+    (a data já está na chave do dia). Devolve True se algo mudou.
+    """
+    alterou = False
+    for dias in registros.values():
+        for usuarios in dias.values():
+            for info in usuarios.values():
+                for campo in ("entrada", "saida"):
+                    valor = info.get(campo)
+                    if valor and " " in valor:
+                        info[campo] = valor.split(" ")[1][:5]
+                        alterou = True
+    return alterou
+
+
+def migrar_arquivo_unico() -> None:
+    """
+    Separa o antigo DATA_FILE (todo o histórico num arquivo só) em um
+    arquivo por mês + mensagens.json + index.json. Se já existir arquivo
+    para algum mês, os registros dele prevalecem sobre os do arquivo antigo.
+    O arquivo antigo é mantido como DATA_FILE + ".migrado".
+    """
+    dados = ler_json(DATA_FILE)
+    registros = migrar_registros(dados.get("registros", {}))
+    migrar_horarios(registros)
+
+    for month_key, dias_mes in registros.items():
+        caminho = _file_for_month(month_key)
+        if os.path.exists(caminho):
+            for date_str, usuarios in ler_json(caminho).items():
+                dias_mes.setdefault(date_str, {}).update(usuarios)
+        ordenar_dias(dias_mes)
+        salvar_json(caminho, dias_mes)
+    salvar_json(MENSAGENS_FILE, dados.get("mensagens", {}))
+    salvar_json(INDEX_FILE, {"meses": sorted(registros)})
+    os.replace(DATA_FILE, DATA_FILE + ".migrado")
+
+
+def ordenar_dias(dias_mes: Dict[str, Any]) -> None:
+    """
+    Reordena, no próprio dict, os dias de um mês em ordem cronológica.
+    """
+    itens = sorted(dias_mes.items())
+    dias_mes.clear()
+    dias_mes.update(itens)
+
+
+def obter_dia(dias_mes: Dict[str, Any], date_str: str) -> Dict[str, Any]:
+    """
+    Devolve os registros de `date_str`, criando o dia se preciso e mantendo
+    `dias_mes` em ordem cronológica (a renderização não precisa ordenar).
+    """
+    usuarios = dias_mes.get(date_str)
+    if usuarios is None:
+        ultimo = next(reversed(dias_mes), None)
+        usuarios = dias_mes[date_str] = {}
+        # normalmente o dia novo é o mais recente; só reordena se não for
+        if ultimo is not None and ultimo > date_str:
+            ordenar_dias(dias_mes)
+    return usuarios
+
+
+def carregar_dados() -> Dict[str, Any]:
+    """
+    Carrega mensagens e o índice de meses; os registros de cada mês só são
+    lidos quando pedidos via carregar_mes.
+    """
+    garantir_arquivo()
+    _meses_indexados.clear()
+    _meses_indexados.update(ler_json(INDEX_FILE).get("meses", []))
+    return {"registros": {}, "mensagens": ler_json(MENSAGENS_FILE)}
+
+
+def inicializar_dados() -> None:
+    """
+    Carrega mensagens e índice em DADOS, uma única vez por processo.
+    """
+    global _carregado
+    if not _carregado:
+        DADOS.update(carregar_dados())
+        _carregado = True
+
+
+def carregar_mes(month_key: str) -> Dict[str, Any]:
+    """
+    Devolve os dias do mês em DADOS, lendo o arquivo do mês na primeira vez.
+    """
+    registros = DADOS.setdefault("registros", {})
+    dias_mes = registros.get(month_key)
+    if dias_mes is None:
+        # o arquivo do mês é a referência; index.json é só informativo e
+        # pode estar desatualizado
+        caminho = _file_for_month(month_key)
+        dias_mes = {}
+        if os.path.exists(caminho):
+            dias_mes = ler_json(caminho)
+            ordenar_dias(dias_mes)
+        registros[month_key] = dias_mes
+    return dias_mes
+
+
+def marcar_alterado(month_key: str | None = None) -> None:
+    """
+    Sinaliza que DADOS mudou: invalida o cache de renderização e agenda a
+    gravação no próximo ciclo de flush_loop. Com `month_key`, marca os
+    registros daquele mês; sem ele, as mensagens.
+    """
+    global _data_version, _mensagens_dirty
+    _data_version += 1
+    if month_key is None:
+        _mensagens_dirty = True
+    else:
+        _meses_dirty.add(month_key)
+
+
+def versao_dados() -> int:
+    return _data_version
+
+
+def flush_dados() -> None:
+    """
+    Grava em disco só os meses (e mensagens) com alterações pendentes.
+    """
+    global _mensagens_dirty
+    novos_meses = False
+    # só tira da lista de pendentes depois de gravar; se salvar_json falhar,
+    # o mês continua pendente para o próximo ciclo
+    for month_key in sorted(_meses_dirty):
+        salvar_json(_file_for_month(month_key), DADOS["registros"][month_key])
+        _meses_dirty.discard(month_key)
+        if month_key not in _meses_indexados:
+            _meses_indexados.add(month_key)
+            novos_meses = True
+    if novos_meses:
+        salvar_json(INDEX_FILE, {"meses": sorted(_meses_indexados)})
+    if _mensagens_dirty:
+        salvar_json(MENSAGENS_FILE, DADOS.get("mensagens", {}))
+        _mensagens_dirty = False
+
+
+async def flush_loop():
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        try:
+            flush_dados()
+        except Exception as e:
+            # mantém o loop vivo; as alterações seguem pendentes
+            print(f"Erro ao gravar dados: {e}")
+
+
+def formatar_mes(year: int, month: int) -> str:
+    return f"{year:04d}-{month:02d}"
+
+
+def get_month_key(dt: datetime) -> str:
+    return formatar_mes(dt.year, dt.month)
+
+
+def get_date_str(dt: datetime) -> str:
+    return f"{dt.year:04d}-{dt.month:02d}-{dt.day:02d}"
+
+
+# ================== FUNÇÃO DE RENDERIZAÇÃO DO CALENDÁRIO ==================
+
+MESES_PT = (
+    None,  # índice 0 não usado; os meses vão de 1 a 12
+    "Janeiro",
+    "Fevereiro",
+    "Março",
+    "Abril",
+    "Maio",
+    "Junho",
+    "Julho",
+    "Agosto",
+    "Setembro",
+    "Outubro",
+    "Novembro",
+    "Dezembro",
+)
+
+_CAL = calendar.Calendar(firstweekday=0)  # Monday
+
+
+@functools.lru_cache(maxsize=64)
+def _grid_lines(year: int, month: int) -> Tuple[str, ...]:
+    """
+    Linhas da grade visual do mês; só dependem de (ano, mês).
+    """
+    linhas = []
+    linhas.append("```")
+    linhas.append("Seg Ter Qua Qui Sex Sáb Dom")
+
+    # monthdayscalendar devolve semanas começando em Monday
+    for week in _CAL.monthdayscalendar(year, month):
+        linha_semana = []
+        # week = [seg, ter, qua, qui, sex, sab, dom]
+        for day in week:
+            if day == 0:
+                linha_semana.append("   ")
+            else:
+                linha_semana.append(f"{day:2d} ")
+        linhas.append(" ".join(linha_semana))
+    linhas.append("```")
+    return tuple(linhas)
+
+
+@functools.lru_cache(maxsize=12)
+def _day_headers(month: int) -> Tuple[str, ...]:
+    """
+    Cabeçalhos "__Dia DD/MM__" do mês, indexados pelo dia; só dependem do mês.
+    """
+    return tuple(f"\n__Dia {d:02d}/{month:02d}__" for d in range(32))
+
+
+def renderizar_calendario(year: int, month: int, registros: Dict[str, Any]) -> str:
+    """
+    Gera texto do calendário + lista de registros por dia.
+    `registros` é o dicionário agrupado por mês ("YYYY-MM" -> "YYYY-MM-DD" -> usuários).
+    """
+    month_key = formatar_mes(year, month)
+
+    # 1) Grade do calendário (visual)
+    grade = _grid_lines(year, month)
+
+    # 2) Detalhes de ponto por dia
+    registros_mes = registros.get(month_key, {})
+
+    if not registros_mes:
+        return "\n".join(grade + ("_Ainda não há registros de ponto neste mês._",))
+
+    # Aloca a lista já no tamanho final (grade + título + uma linha por dia
+    # + uma por usuário) e preenche por índice, com um único join no fim
+    n_users = sum(len(u) for u in registros_mes.values())
+    linhas: list = [None] * (len(grade) + 1 + len(registros_mes) + n_users)
+    i = len(grade)
+    linhas[:i] = grade
+    linhas[i] = "**Registros de ponto por dia:**"
+    i += 1
+    fmt = "- {}: entrada {} | saída {}".format
+    day_headers = _day_headers(month)
+    # Os dias já ficam em ordem cronológica (ver obter_dia/ordenar_dias)
+    for data_str, usuarios in registros_mes.items():
+        dia = int(data_str[-2:])  # chave já vem no formato "YYYY-MM-DD"
+        linhas[i] = day_headers[dia]
+        i += 1
+        # registrar_ponto sempre preenche name/entrada/saida
+        for info in usuarios.values():
+            linhas[i] = fmt(info["name"], info["entrada"], info["saida"])
+            i += 1
+
+    return "\n".join(linhas)